@@ -1,8 +1,17 @@
 import os
+import re
 import xarray as xr
 from datetime import datetime
 import glob
 
+# dask enables the parallel lazy combine below; without it we fall back to
+# streaming the files into the output one at a time (constant memory).
+try:
+    import dask  # noqa: F401
+    _HAS_DASK = True
+except ImportError:
+    _HAS_DASK = False
+
 # --- Configuration ---
 # The directory containing the individual .nc files
 input_dir = "/mnt/cty/qiu/Pangu-Weather-ReadyToGo/outputs/2018-10-01-06-00to_v22018-10-06-06-00"
@@ -19,48 +28,100 @@ print(f"Will process '{file_type_to_process}' files.")
 
 # --- Script Logic ---
 
-# 1. Find all the relevant .nc files and sort them chronologically
+# 1. Find all the relevant .nc files, parse their timestamps once, and sort
+# them chronologically (rather than lexically, which only works because the
+# filenames happen to be zero-padded). Files that do not match the expected
+# pattern are dropped here, before anything is opened.
+# Expected format: output_upper_YYYY-MM-DD-HH-MM.nc
 search_pattern = os.path.join(input_dir, f"output_{file_type_to_process}_*.nc")
-file_paths = sorted(glob.glob(search_pattern))
+time_pattern = re.compile(rf"output_{file_type_to_process}_(\d{{4}}-\d{{2}}-\d{{2}}-\d{{2}}-\d{{2}})\.nc$")
+
+entries = []
+for fp in glob.glob(search_pattern):
+    m = time_pattern.match(os.path.basename(fp))
+    if m:
+        entries.append((datetime.strptime(m.group(1), "%Y-%m-%d-%H-%M"), fp))
+    else:
+        print(f"Warning: Could not parse time from filename: {os.path.basename(fp)}. Skipping.")
+entries.sort()
 
-if not file_paths:
+if not entries:
     print(f"Error: No '{file_type_to_process}' .nc files found in the directory.")
     exit()
 
-print(f"Found {len(file_paths)} files to combine.")
+print(f"Found {len(entries)} files to combine.")
 
-# 2. Define a preprocessing function to add the time coordinate from the filename
+valid_paths = [fp for _, fp in entries]
+# Pre-parsed timestamp per file, so the preprocess step below is a dict
+# lookup instead of a per-dataset strptime.
+file_times = {os.path.basename(fp): dt for dt, fp in entries}
+
+# 2. Preprocessing function: attach the (pre-parsed) time coordinate
 def add_time_coordinate(ds):
-    # Extract the filename from the full path
-    filename = os.path.basename(ds.encoding['source'])
-    # Expected format: output_upper_YYYY-MM-DD-HH-MM.nc
-    time_str = filename.replace(f"output_{file_type_to_process}_", "").replace(".nc", "")
-    
-    try:
-        # Convert the string to a datetime object
-        dt_object = datetime.strptime(time_str, "%Y-%m-%d-%H-%M")
-        # Expand the dataset with a new 'time' dimension
-        return ds.expand_dims(time=[dt_object])
-    except ValueError:
-        print(f"Warning: Could not parse time from filename: {filename}. Skipping.")
-        return None
-
-# 3. Open all datasets, apply the preprocessing function, and concatenate them
-print("Opening and preprocessing datasets...")
-datasets = [add_time_coordinate(xr.open_dataset(fp)) for fp in file_paths]
-# Filter out any datasets that failed preprocessing
-valid_datasets = [ds for ds in datasets if ds is not None]
-
-if not valid_datasets:
-    print("Error: No valid datasets could be processed.")
-    exit()
+    dt_object = file_times[os.path.basename(ds.encoding['source'])]
+    # Keep Pangu outputs at float32 (4 bytes/cell): any float64 upcast would
+    # double memory traffic here and in every downstream scan of the cube.
+    for v in ds.data_vars:
+        ds[v] = ds[v].astype('float32', copy=False)
+    # Expand the dataset with a new 'time' dimension
+    return ds.expand_dims(time=[dt_object])
+
+# Encoding used for the combined output file.
+# Light zlib compression (complevel=1 is the cost/ratio sweet spot) shrinks
+# the file, and chunks of 1 along time match how the tracking/intensity
+# scripts read it later (one small lat/lon window per timestep).
+def make_encoding(ds):
+    encoding = {}
+    for v in ds.data_vars:
+        dims = ds[v].dims
+        encoding[v] = {
+            'zlib': True,
+            'complevel': 1,
+            'dtype': 'float32',
+            'chunksizes': tuple(1 if d == 'time' else min(80, ds.sizes[d]) for d in dims),
+        }
+    return encoding
+
+if _HAS_DASK:
+    # 3a. Open and combine all files in one go. open_mfdataset with
+    # parallel=True opens/preprocesses the files concurrently via dask and
+    # concatenates lazily, instead of opening N files sequentially and
+    # holding them all in memory.
+    print("Opening and combining datasets along the 'time' dimension...")
+    combined_ds = xr.open_mfdataset(valid_paths, preprocess=add_time_coordinate,
+                                    combine='nested', concat_dim='time',
+                                    parallel=True, engine='netcdf4')
+
+    print(f"Saving combined file to: {output_filepath}")
+    combined_ds.to_netcdf(output_filepath, encoding=make_encoding(combined_ds))
+else:
+    # 3b. Stream the concatenation: write the first file with an unlimited
+    # time dimension, then append each remaining file's slab along time via
+    # netCDF4. RAM stays at single-file size regardless of how many files
+    # the forecast run produced.
+    import netCDF4
 
-print("Combining datasets along the 'time' dimension...")
-combined_ds = xr.concat(valid_datasets, dim="time")
+    print("dask not available; streaming the concatenation file by file...")
+    with xr.open_dataset(valid_paths[0]) as first:
+        first = add_time_coordinate(first)
+        encoding = make_encoding(first)
+        # Pin the time encoding: left to itself xarray may pick integer days,
+        # which would truncate the sub-daily timestamps appended below.
+        encoding['time'] = {'units': 'hours since 1900-01-01 00:00:00', 'dtype': 'float64'}
+        first.to_netcdf(output_filepath, mode='w', unlimited_dims=['time'],
+                        encoding=encoding)
 
-# 4. Save the combined dataset to a new NetCDF file
-print(f"Saving combined file to: {output_filepath}")
-combined_ds.to_netcdf(output_filepath)
+    with netCDF4.Dataset(output_filepath, 'a') as nc:
+        tvar = nc.variables['time']
+        calendar = getattr(tvar, 'calendar', 'standard')
+        for fp in valid_paths[1:]:
+            dt_object = file_times[os.path.basename(fp)]
+            with xr.open_dataset(fp) as ds:
+                n = tvar.shape[0]
+                tvar[n] = netCDF4.date2num(dt_object, tvar.units, calendar)
+                for v in ds.data_vars:
+                    if v in nc.variables:
+                        nc.variables[v][n, ...] = ds[v].values
 
 print("\nDone! Your time-series file is ready.")
 print(f"You can now open '{output_filepath}' in Panoply.")
\ No newline at end of file
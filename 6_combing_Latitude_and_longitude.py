@@ -1,8 +1,17 @@
 import os
+import re
 import xarray as xr
 from datetime import datetime
 import glob
 
+# dask enables the parallel lazy combine below; without it we fall back to
+# streaming the filtered files into the output one at a time (constant memory).
+try:
+    import dask  # noqa: F401
+    _HAS_DASK = True
+except ImportError:
+    _HAS_DASK = False
+
 # --- Configuration ---
 # The directory containing the individual .nc files
 input_dir = "/mnt/cty/qiu/Pangu-Weather-ReadyToGo/outputs/2018-07-18-20-00to_v22018-07-25-02-00"
@@ -21,74 +30,125 @@ print(f"Will process '{file_type_to_process}' files.")
 
 # --- Script Logic ---
 
-# 1. Find all the relevant .nc files and sort them chronologically
+# 1. Find all the relevant .nc files, parse their timestamps once, and sort
+# them chronologically (rather than lexically, which only works because the
+# filenames happen to be zero-padded). Files that do not match the expected
+# pattern are dropped here, before anything is opened.
+# Expected format: output_upper_YYYY-MM-DD-HH-MM.nc
 search_pattern = os.path.join(input_dir, f"output_{file_type_to_process}_*.nc")
-file_paths = sorted(glob.glob(search_pattern))
+time_pattern = re.compile(rf"output_{file_type_to_process}_(\d{{4}}-\d{{2}}-\d{{2}}-\d{{2}}-\d{{2}})\.nc$")
+
+entries = []
+for fp in glob.glob(search_pattern):
+    m = time_pattern.match(os.path.basename(fp))
+    if m:
+        entries.append((datetime.strptime(m.group(1), "%Y-%m-%d-%H-%M"), fp))
+    else:
+        print(f"Warning: Could not parse time from filename: {os.path.basename(fp)}. Skipping.")
+entries.sort()
 
-if not file_paths:
+if not entries:
     print(f"Error: No '{file_type_to_process}' .nc files found in the directory.")
     exit()
 
-print(f"Found {len(file_paths)} files to combine.")
-
-# 2. Define a preprocessing function to add the time coordinate from the filename
-def add_time_coordinate(ds):
-    # Extract the filename from the full path
-    filename = os.path.basename(ds.encoding['source'])
-    # Expected format: output_upper_YYYY-MM-DD-HH-MM.nc
-    time_str = filename.replace(f"output_{file_type_to_process}_", "").replace(".nc", "")
-    
-    try:
-        # Convert the string to a datetime object
-        dt_object = datetime.strptime(time_str, "%Y-%m-%d-%H-%M")
-        # Expand the dataset with a new 'time' dimension
-        return ds.expand_dims(time=[dt_object])
-    except ValueError:
-        print(f"Warning: Could not parse time from filename: {filename}. Skipping.")
-        return None
-
-# 3. Open all datasets, apply the preprocessing function, and concatenate them
-print("Opening and preprocessing datasets...")
-# Open datasets lazily using xarray
-datasets = [add_time_coordinate(xr.open_dataset(fp)) for fp in file_paths]
-# Filter out any datasets that failed preprocessing
-valid_datasets = [ds for ds in datasets if ds is not None]
-
-if not valid_datasets:
-    print("Error: No valid datasets could be processed.")
-    exit()
+print(f"Found {len(entries)} files to combine.")
 
-print("Combining datasets along the 'time' dimension...")
-combined_ds = xr.concat(valid_datasets, dim="time")
+valid_paths = [fp for _, fp in entries]
+# Pre-parsed timestamp per file, so the preprocess step below is a dict
+# lookup instead of a per-dataset strptime.
+file_times = {os.path.basename(fp): dt for dt, fp in entries}
 
-# 4. Filter for the specific region: 20N-40N, 115E-140E
-print("Filtering for region: 20N-40N, 115E-140E...")
+# 2. Preprocessing function: attach the (pre-parsed) time coordinate and cut
+# each file down to the target region. Filtering per file means the concat
+# only ever handles the ~150x280 subregion instead of the full global grid
+# (~25x more cells), so peak memory and write time scale down accordingly.
+def add_time_coordinate(ds):
+    dt_object = file_times[os.path.basename(ds.encoding['source'])]
+    # Keep Pangu outputs at float32 (4 bytes/cell): any float64 upcast would
+    # double memory traffic here and in every downstream scan of the cube.
+    for v in ds.data_vars:
+        ds[v] = ds[v].astype('float32', copy=False)
+    lat_slice, lon_slice = region_slices(ds['latitude'].values)
+    ds = ds.sel(latitude=lat_slice, longitude=lon_slice)
+    # Expand the dataset with a new 'time' dimension
+    return ds.expand_dims(time=[dt_object])
+
+# Encoding used for the filtered output file.
+# Light zlib compression (complevel=1 is the cost/ratio sweet spot) shrinks
+# the file, and chunks of 1 along time match how the tracking/intensity
+# scripts read it later (small per-timestep windows).
+def make_encoding(ds):
+    encoding = {}
+    for v in ds.data_vars:
+        dims = ds[v].dims
+        encoding[v] = {
+            'zlib': True,
+            'complevel': 1,
+            'dtype': 'float32',
+            'chunksizes': tuple(1 if d == 'time' else min(80, ds.sizes[d]) for d in dims),
+        }
+    return encoding
 
 # Note: ERA5 latitude is typically ordered North to South (e.g., 90 to -90).
 # So we select from higher value to lower value for latitude.
 # Longitude is typically 0 to 360.
-try:
+def region_slices(lat_values):
     # Check if latitude is increasing or decreasing to handle slice correctly
-    lat_0 = combined_ds['latitude'].values[0]
-    lat_1 = combined_ds['latitude'].values[1]
-    
-    if lat_0 > lat_1:
+    if lat_values[0] > lat_values[1]:
         # Descending latitude (90 -> -90)
         lat_slice = slice(50, 10)
     else:
         # Ascending latitude (-90 -> 90)
         lat_slice = slice(10, 50)
-        
-    filtered_ds = combined_ds.sel(
-        latitude=lat_slice,
-        longitude=slice(90, 160)
-    )
-    
-    print(f"Filtered dataset dimensions: {filtered_ds.dims}")
-
-    # 5. Save the combined dataset to a new NetCDF file
-    print(f"Saving combined filtered file to: {output_filepath}")
-    filtered_ds.to_netcdf(output_filepath)
+    return lat_slice, slice(90, 160)
+
+try:
+    if _HAS_DASK:
+        # 3a. Open and combine all files in one go. open_mfdataset with
+        # parallel=True opens/preprocesses the files concurrently via dask
+        # and concatenates lazily; the preprocess hook already cut each file
+        # to region 10N-50N, 90E-160E, so only the subregion is combined.
+        print("Opening and combining datasets along the 'time' dimension...")
+        print("Filtering for region: 10N-50N, 90E-160E (per file, during preprocessing)...")
+        filtered_ds = xr.open_mfdataset(valid_paths, preprocess=add_time_coordinate,
+                                        combine='nested', concat_dim='time',
+                                        parallel=True, engine='netcdf4')
+
+        print(f"Filtered dataset dimensions: {filtered_ds.dims}")
+
+        # 4. Save the combined dataset to a new NetCDF file
+        print(f"Saving combined filtered file to: {output_filepath}")
+        filtered_ds.to_netcdf(output_filepath, encoding=make_encoding(filtered_ds))
+    else:
+        # 3b. Stream the concatenation: write the first file (already cut to
+        # the region) with an unlimited time dimension, then append each
+        # remaining file's filtered slab along time via netCDF4. RAM stays at
+        # single-file size regardless of how many files the run produced.
+        import netCDF4
+
+        print("dask not available; streaming the filtered concatenation file by file...")
+        with xr.open_dataset(valid_paths[0]) as first:
+            lat_slice, lon_slice = region_slices(first['latitude'].values)
+            first = add_time_coordinate(first)  # also applies the region cut
+            encoding = make_encoding(first)
+            # Pin the time encoding: left to itself xarray may pick integer
+            # days, which would truncate the sub-daily timestamps appended below.
+            encoding['time'] = {'units': 'hours since 1900-01-01 00:00:00', 'dtype': 'float64'}
+            first.to_netcdf(output_filepath, mode='w', unlimited_dims=['time'],
+                            encoding=encoding)
+
+        with netCDF4.Dataset(output_filepath, 'a') as nc:
+            tvar = nc.variables['time']
+            calendar = getattr(tvar, 'calendar', 'standard')
+            for fp in valid_paths[1:]:
+                dt_object = file_times[os.path.basename(fp)]
+                with xr.open_dataset(fp) as ds:
+                    ds = ds.sel(latitude=lat_slice, longitude=lon_slice)
+                    n = tvar.shape[0]
+                    tvar[n] = netCDF4.date2num(dt_object, tvar.units, calendar)
+                    for v in ds.data_vars:
+                        if v in nc.variables:
+                            nc.variables[v][n, ...] = ds[v].values
 
     print("\nDone! Your filtered time-series file is ready.")
     print(f"You can now open '{output_filepath}' in Panoply.")
@@ -1,9 +1,18 @@
 import xarray as xr
 
+# Prefer the h5netcdf engine for reading (faster metadata scan); fall back
+# to xarray's default engine selection when it is not installed.
+try:
+    import h5netcdf  # noqa: F401
+    import h5py  # noqa: F401  (h5netcdf needs it at read time)
+    engine = 'h5netcdf'
+except ImportError:
+    engine = None
+
 file_path = '/mnt/cty/qiu/Pangu-Weather-ReadyToGo/outputs/2018-10-01-06-00to_v22018-10-06-06-00/combined_surface_timeseries.nc'
 
 try:
-    ds = xr.open_dataset(file_path)
+    ds = xr.open_dataset(file_path, engine=engine)
     print("Dataset Information:")
     print(ds)
     print("\nData Variables:")
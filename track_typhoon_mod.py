@@ -0,0 +1 @@
+8_track_typhoon.py
\ No newline at end of file